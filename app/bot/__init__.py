@@ -1,6 +1,8 @@
 
-from app.bot.categorizer import MessageCategorizer
+from app.bot.categorizer import CategoryScore, MessageCategorizer, SqlKeywordMatcher
 from app.bot.handlers import (
+    CategoryCache,
+    MessageWriter,
     TelegramMessageHandler,
     CategoryManagementHandler,
     StatisticsHandler,
@@ -8,7 +10,11 @@ from app.bot.handlers import (
 )
 
 __all__ = [
+    "CategoryScore",
     "MessageCategorizer",
+    "SqlKeywordMatcher",
+    "CategoryCache",
+    "MessageWriter",
     "TelegramMessageHandler",
     "CategoryManagementHandler",
     "StatisticsHandler",
@@ -2,12 +2,170 @@
 Módulo de categorización de mensajes usando palabras clave y similitud fuzzy.
 """
 
-from difflib import SequenceMatcher
-from typing import Optional
+from typing import NamedTuple, Optional
+
+import numpy as np
+from rapidfuzz import fuzz, process
+from sqlalchemy import String, any_, bindparam, delete, func, insert, select
+from sqlalchemy.dialects.postgresql import ARRAY
 
 from app.config import config
-from app.models import Category
-from app.utils import LoggerConfig, TextNormalizer, StringHelper
+from app.models import Category, Keyword
+from app.utils import LoggerConfig, TextNormalizer
+
+
+logger = LoggerConfig.setup_logger(__name__)
+
+
+class CategoryScore(NamedTuple):
+    """
+    Resultado de puntuar un mensaje contra una categoría.
+    
+    Attributes:
+        category: Nombre de la categoría
+        score: Confidence score final (0.0 a 1.0)
+        exact: Score por coincidencia exacta de keywords
+        fuzzy: Score por similitud fuzzy
+    """
+    
+    category: str
+    score: float
+    exact: float = 0.0
+    fuzzy: float = 0.0
+
+
+class KeywordIndex:
+    """
+    Índice invertido de palabras clave normalizadas hacia categorías.
+    
+    Se construye una sola vez por conjunto de categorías, de modo que el
+    matching exacto recorre solo las palabras del mensaje en lugar de
+    re-normalizar todas las keywords de todas las categorías.
+    """
+    
+    def __init__(self, categories: list[Category]):
+        self.categories = categories
+        self.snapshot = self.build_snapshot(categories)
+        self.category_names = [category.name for category in categories]
+        self.keyword_totals = [len(category.keywords) for category in categories]
+        self.keyword_sets: list[frozenset[str]] = []
+        self.category_texts: list[str] = []
+        self.keyword_map: dict[str, list[int]] = {}
+        
+        for index, category in enumerate(categories):
+            self.keyword_sets.append(category.normalized_keywords)
+            self.category_texts.append(category.normalized_text)
+            
+            for keyword in category.keywords:
+                normalized_keyword = TextNormalizer.clean_and_normalize(keyword)
+                self.keyword_map.setdefault(normalized_keyword, []).append(index)
+    
+    @staticmethod
+    def build_snapshot(categories: list[Category]) -> tuple:
+        return tuple((category.name, tuple(category.keywords)) for category in categories)
+    
+    def count_matches(self, message_words: set[str]) -> Optional[np.ndarray]:
+        """
+        Cuenta, en una sola pasada, las keywords encontradas por categoría.
+        Retorna None si ninguna palabra del mensaje es keyword.
+        """
+        matched_indexes = []
+        for word in message_words:
+            category_indexes = self.keyword_map.get(word)
+            if category_indexes:
+                matched_indexes.extend(category_indexes)
+        
+        if not matched_indexes:
+            return None
+        
+        return np.bincount(matched_indexes, minlength=len(self.category_names))
+
+
+class SqlKeywordMatcher:
+    """
+    Matching exacto resuelto en PostgreSQL sobre la tabla `keywords`.
+    
+    Equivale a KeywordIndex.count_matches + argmax: una única consulta
+    indexada devuelve la categoría con más keywords presentes en el mensaje
+    (ante empate, la de menor id, igual que el orden del CategoryCache).
+    Se activa con SQL_KEYWORD_MATCHING.
+    """
+    
+    def __init__(self, db_session_factory):
+        self.db_session_factory = db_session_factory
+        match_count = func.count(Keyword.id)
+        self._best_match_query = (
+            select(
+                Category.name,
+                match_count,
+                func.cardinality(Category.keywords)
+            )
+            .join(Keyword, Keyword.category_id == Category.id)
+            .where(Keyword.keyword == any_(bindparam("words", type_=ARRAY(String))))
+            .group_by(Category.id)
+            .order_by(match_count.desc(), Category.id)
+            .limit(1)
+        )
+    
+    async def find_best_match(self, message_words: set[str]) -> Optional[tuple[str, int, int]]:
+        """
+        Retorna (categoría, keywords encontradas, total de keywords) o None
+        si ninguna palabra del mensaje es keyword.
+        """
+        return (await self.find_best_matches([message_words]))[0]
+    
+    async def find_best_matches(
+        self,
+        word_sets: list[set[str]]
+    ) -> list[Optional[tuple[str, int, int]]]:
+        """
+        Como find_best_match para varios mensajes, con una sola sesión para
+        todo el lote. Retorna un resultado por conjunto, en el mismo orden.
+        """
+        best_matches = []
+        async with self.db_session_factory() as session:
+            for message_words in word_sets:
+                if not message_words:
+                    best_matches.append(None)
+                    continue
+                
+                result = await session.execute(
+                    self._best_match_query, {"words": list(message_words)}
+                )
+                row = result.first()
+                best_matches.append(None if row is None else (row[0], row[1], row[2]))
+        
+        return best_matches
+    
+    async def ensure_keywords(self) -> int:
+        """
+        Completa la tabla `keywords` a partir de `categories.keywords` si hay
+        categorías sin filas (p. ej. creadas antes de existir la tabla).
+        Retorna la cantidad de filas generadas.
+        """
+        async with self.db_session_factory() as session:
+            missing = await session.scalar(
+                select(
+                    select(Category.id)
+                    .where(~Category.id.in_(select(Keyword.category_id)))
+                    .exists()
+                )
+            )
+            if not missing:
+                return 0
+            
+            result = await session.execute(select(Category))
+            rows = []
+            for category in result.scalars():
+                rows.extend(Keyword.build_rows(category.id, category.keywords))
+            
+            await session.execute(delete(Keyword))
+            if rows:
+                await session.execute(insert(Keyword), rows)
+            await session.commit()
+        
+        logger.info("Tabla keywords regenerada: %d filas", len(rows))
+        return len(rows)
 
 
 class MessageCategorizer:
@@ -16,7 +174,7 @@ class MessageCategorizer:
     
     Proceso de categorización:
     1. Busca coincidencias exactas con palabras clave
-    2. Si no encuentra, usa difflib para similitud fuzzy
+    2. Si no encuentra, usa rapidfuzz para similitud fuzzy
     3. Retorna la categoría con mayor confidence score
     4. Si ninguna supera el threshold, asigna categoría por defecto
     """
@@ -24,79 +182,201 @@ class MessageCategorizer:
     def __init__(self, similarity_threshold: Optional[float] = None):
         self.similarity_threshold = similarity_threshold or config.similarity_threshold
         self.default_category = config.default_category
-        self.logger = LoggerConfig.setup_logger(__name__)
+        self._keyword_index: Optional[KeywordIndex] = None
     
-    def categorize_message(self, message_text: str, categories: list[Category]) -> dict:
+    def categorize_message(
+        self,
+        message_text: str,
+        categories: list[Category],
+        keyword_index: Optional[KeywordIndex] = None,
+        normalized_message: Optional[str] = None
+    ) -> CategoryScore:
+        """
+        `normalized_message`, si se pasa, debe ser
+        TextNormalizer.clean_and_normalize(message_text) ya calculado por el
+        llamador; así el texto no se normaliza dos veces.
+        """
         if not message_text or not categories:
-            return {
-                'category': self.default_category,
-                'confidence_score': 0.0
-            }
+            return CategoryScore(self.default_category, 0.0)
         
-        normalized_message = TextNormalizer.clean_and_normalize(message_text)
-        message_words = set(StringHelper.extract_words(normalized_message))
+        if normalized_message is None:
+            normalized_message = TextNormalizer.clean_and_normalize(message_text)
+        message_words = self._extract_message_words(normalized_message)
+        
+        keyword_index = self._get_keyword_index(categories, keyword_index)
         
-        exact_match = self._find_exact_keyword_match(message_words, categories)
+        exact_match = self._find_exact_keyword_match(message_words, keyword_index)
         if exact_match:
             return exact_match
         
-        fuzzy_match = self._find_fuzzy_match(normalized_message, categories)
+        fuzzy_match = self._find_fuzzy_match(normalized_message, keyword_index)
         if fuzzy_match:
             return fuzzy_match
         
-        self.logger.debug(f"No se encontró categoría para: '{message_text[:50]}'")
-        return {
-            'category': self.default_category,
-            'confidence_score': 0.0
-        }
-    
-    def _find_exact_keyword_match(self, message_words: set[str], categories: list[Category]) -> Optional[dict]:
-        best_match = None
-        max_matches = 0
-        
-        for category in categories:
-            normalized_keywords = [
-                TextNormalizer.clean_and_normalize(kw) 
-                for kw in category.keywords
-            ]
-            
-            matches = sum(1 for keyword in normalized_keywords if keyword in message_words)
-            
-            if matches > max_matches:
-                max_matches = matches
-                total_keywords = len(normalized_keywords)
-                confidence = min(matches / total_keywords, 1.0)
-                
-                best_match = {
-                    'category': category.name,
-                    'confidence_score': confidence
-                }
+        logger.debug("No se encontró categoría para: '%.50s'", message_text)
+        return CategoryScore(self.default_category, 0.0)
+    
+    async def categorize_message_with_sql(
+        self,
+        message_text: str,
+        categories: list[Category],
+        keyword_matcher: SqlKeywordMatcher,
+        keyword_index: Optional[KeywordIndex] = None,
+        normalized_message: Optional[str] = None
+    ) -> CategoryScore:
+        """
+        Igual que categorize_message, pero el matching exacto se resuelve en
+        la base con SqlKeywordMatcher. El fuzzy sigue usando las categorías
+        en memoria.
+        """
+        if not message_text or not categories:
+            return CategoryScore(self.default_category, 0.0)
+        
+        if normalized_message is None:
+            normalized_message = TextNormalizer.clean_and_normalize(message_text)
+        message_words = self._extract_message_words(normalized_message)
+        
+        best_match = await keyword_matcher.find_best_match(message_words)
+        return self._categorize_with_best_match(
+            message_text, normalized_message, best_match, categories, keyword_index
+        )
+    
+    def categorize_batch(
+        self,
+        messages: list[str],
+        categories: list[Category],
+        keyword_index: Optional[KeywordIndex] = None
+    ) -> list[CategoryScore]:
+        """
+        Categoriza varios mensajes contra las mismas categorías, resolviendo
+        el índice de keywords una sola vez para todo el lote. Los resultados
+        vienen en el orden de `messages`, listos para guardarse juntos con
+        Message.bulk_create.
+        """
+        if not categories:
+            return [CategoryScore(self.default_category, 0.0) for _ in messages]
+        
+        keyword_index = self._get_keyword_index(categories, keyword_index)
+        return [
+            self.categorize_message(message_text, categories, keyword_index=keyword_index)
+            for message_text in messages
+        ]
+    
+    async def categorize_batch_with_sql(
+        self,
+        messages: list[str],
+        categories: list[Category],
+        keyword_matcher: SqlKeywordMatcher,
+        keyword_index: Optional[KeywordIndex] = None
+    ) -> list[CategoryScore]:
+        """
+        Igual que categorize_batch, pero con el matching exacto de
+        categorize_message_with_sql, resuelto en una sola sesión de base.
+        """
+        if not categories:
+            return [CategoryScore(self.default_category, 0.0) for _ in messages]
+        
+        normalized_messages = [
+            TextNormalizer.clean_and_normalize(message_text) if message_text else ""
+            for message_text in messages
+        ]
+        best_matches = await keyword_matcher.find_best_matches([
+            self._extract_message_words(normalized_message)
+            for normalized_message in normalized_messages
+        ])
+        
+        keyword_index = self._get_keyword_index(categories, keyword_index)
+        return [
+            self._categorize_with_best_match(
+                message_text, normalized_message, best_match, categories, keyword_index
+            )
+            if message_text else CategoryScore(self.default_category, 0.0)
+            for message_text, normalized_message, best_match
+            in zip(messages, normalized_messages, best_matches)
+        ]
+    
+    def _categorize_with_best_match(
+        self,
+        message_text: str,
+        normalized_message: str,
+        best_match: Optional[tuple[str, int, int]],
+        categories: list[Category],
+        keyword_index: Optional[KeywordIndex] = None
+    ) -> CategoryScore:
+        if best_match:
+            exact_match = self._score_exact_match(*best_match)
+            if exact_match:
+                return exact_match
+        
+        keyword_index = self._get_keyword_index(categories, keyword_index)
+        fuzzy_match = self._find_fuzzy_match(normalized_message, keyword_index)
+        if fuzzy_match:
+            return fuzzy_match
+        
+        logger.debug("No se encontró categoría para: '%.50s'", message_text)
+        return CategoryScore(self.default_category, 0.0)
+    
+    def _extract_message_words(self, normalized_message: str) -> set[str]:
+        # El texto ya pasó por clean_and_normalize: solo quedan [a-z0-9] y espacios
+        # simples, así que split() equivale a StringHelper.extract_words sin
+        # volver a ejecutar las tres pasadas de regex de la normalización.
+        return set(normalized_message.split())
+    
+    def _get_keyword_index(
+        self,
+        categories: list[Category],
+        keyword_index: Optional[KeywordIndex] = None
+    ) -> KeywordIndex:
+        # Índice ya construido por el CategoryCache para esta misma lista
+        if keyword_index is not None and keyword_index.categories is categories:
+            return keyword_index
+        
+        # El CategoryCache devuelve la misma lista hasta que se invalida
+        if self._keyword_index is not None and self._keyword_index.categories is categories:
+            return self._keyword_index
         
-        if best_match and best_match['confidence_score'] >= self.similarity_threshold:
-            self.logger.info(f"Match exacto: {best_match['category']} (score: {best_match['confidence_score']:.2f})")
+        snapshot = KeywordIndex.build_snapshot(categories)
+        if self._keyword_index is None or self._keyword_index.snapshot != snapshot:
+            self._keyword_index = KeywordIndex(categories)
+            logger.debug("Índice de keywords reconstruido (%d categorías)", len(categories))
+        else:
+            self._keyword_index.categories = categories
+        return self._keyword_index
+    
+    def _find_exact_keyword_match(self, message_words: set[str], keyword_index: KeywordIndex) -> Optional[CategoryScore]:
+        match_counts = keyword_index.count_matches(message_words)
+        if match_counts is None:
+            return None
+        
+        # argmax devuelve el primer máximo: ante empate gana la primera categoría
+        best_index = int(match_counts.argmax())
+        return self._score_exact_match(
+            keyword_index.category_names[best_index],
+            int(match_counts[best_index]),
+            keyword_index.keyword_totals[best_index]
+        )
+    
+    def _score_exact_match(self, category_name: str, matches: int, total_keywords: int) -> Optional[CategoryScore]:
+        confidence = min(matches / total_keywords, 1.0)
+        best_match = CategoryScore(category_name, confidence, exact=confidence)
+        
+        if best_match.score >= self.similarity_threshold:
+            logger.info("Match exacto: %s (score: %.2f)", best_match.category, best_match.score)
             return best_match
         
         return None
     
-    def _find_fuzzy_match(self, normalized_message: str, categories: list[Category]) -> Optional[dict]:
-        best_match = None
-        max_similarity = 0.0
+    def _find_fuzzy_match(self, normalized_message: str, keyword_index: KeywordIndex) -> Optional[CategoryScore]:
+        similarities = self._calculate_similarities(normalized_message, keyword_index.category_texts)
         
-        for category in categories:
-            category_text = " ".join(category.keywords)
-            normalized_category_text = TextNormalizer.clean_and_normalize(category_text)
-            
-            similarity = self._calculate_similarity(normalized_message, normalized_category_text)
-            
-            if similarity > max_similarity:
-                max_similarity = similarity
-                best_match = {
-                    'category': category.name,
-                    'confidence_score': similarity
-                }
-        
-        if best_match and best_match['confidence_score'] >= self.similarity_threshold:
-            self.logger.info(f"Match fuzzy: {best_match['category']} (score: {best_match['confidence_score']:.2f})")
+        best_index = int(similarities.argmax())
+        max_similarity = float(similarities[best_index])
+        
+        if max_similarity > 0.0 and max_similarity >= self.similarity_threshold:
+            best_match = CategoryScore(
+                keyword_index.category_names[best_index], max_similarity, fuzzy=max_similarity
+            )
+            logger.info("Match fuzzy: %s (score: %.2f)", best_match.category, best_match.score)
             return best_match
         
         return None
@@ -105,54 +385,60 @@ class MessageCategorizer:
         if not text_a or not text_b:
             return 0.0
         
-        sequence_matcher = SequenceMatcher(None, text_a, text_b)
-        return sequence_matcher.ratio()
+        return fuzz.ratio(text_a, text_b) / 100.0
     
-    def _calculate_keyword_similarity(self, message_words: set[str], keywords: list[str]) -> float:
-        if not message_words or not keywords:
-            return 0.0
-        
-        normalized_keywords = [
-            TextNormalizer.clean_and_normalize(kw) 
-            for kw in keywords
-        ]
+    def _calculate_similarities(self, text: str, candidates: list[str]) -> np.ndarray:
+        if not text:
+            return np.zeros(len(candidates), dtype=np.float64)
         
-        max_similarities = []
-        for message_word in message_words:
-            word_similarities = [
-                self._calculate_similarity(message_word, keyword)
-                for keyword in normalized_keywords
-            ]
-            if word_similarities:
-                max_similarities.append(max(word_similarities))
-        
-        if not max_similarities:
+        similarity_row = process.cdist([text], candidates, scorer=fuzz.ratio, dtype=np.float64)[0]
+        return similarity_row / 100.0
+    
+    def _calculate_keyword_similarity(self, message_words: set[str], normalized_keywords: frozenset[str]) -> float:
+        if not message_words or not normalized_keywords:
             return 0.0
         
-        return sum(max_similarities) / len(max_similarities)
+        similarity_matrix = process.cdist(
+            list(message_words),
+            list(normalized_keywords),
+            scorer=fuzz.ratio
+        )
+        return float(similarity_matrix.max(axis=1).mean()) / 100.0
     
-    def get_category_scores(self, message_text: str, categories: list[Category]) -> list[dict]:
+    def get_category_scores(
+        self,
+        message_text: str,
+        categories: list[Category],
+        top_k: Optional[int] = None
+    ) -> list[CategoryScore]:
         normalized_message = TextNormalizer.clean_and_normalize(message_text)
-        message_words = set(StringHelper.extract_words(normalized_message))
+        message_words = self._extract_message_words(normalized_message)
         
-        scores = []
-        for category in categories:
-            category_text = " ".join(category.keywords)
-            normalized_category_text = TextNormalizer.clean_and_normalize(category_text)
-            
-            exact_score = len(message_words.intersection(
-                set(TextNormalizer.clean_and_normalize(kw) for kw in category.keywords)
-            )) / len(category.keywords) if category.keywords else 0.0
-            
-            fuzzy_score = self._calculate_similarity(normalized_message, normalized_category_text)
-            
-            final_score = max(exact_score, fuzzy_score)
-            
-            scores.append({
-                'category': category.name,
-                'score': final_score,
-                'exact_matches': exact_score,
-                'fuzzy_similarity': fuzzy_score
-            })
-        
-        return sorted(scores, key=lambda x: x['score'], reverse=True)
\ No newline at end of file
+        keyword_index = self._get_keyword_index(categories)
+        fuzzy_scores = self._calculate_similarities(normalized_message, keyword_index.category_texts)
+        exact_scores = np.fromiter(
+            (
+                len(message_words & keyword_set) / total_keywords if total_keywords else 0.0
+                for keyword_set, total_keywords in zip(keyword_index.keyword_sets, keyword_index.keyword_totals)
+            ),
+            dtype=np.float64,
+            count=len(keyword_index.category_names)
+        )
+        final_scores = np.maximum(exact_scores, fuzzy_scores)
+        
+        # Orden descendente estable: ante empate se respeta el orden de las categorías
+        if top_k is not None and top_k < len(final_scores):
+            candidates = np.argpartition(-final_scores, top_k)[:top_k]
+            order = candidates[np.lexsort((candidates, -final_scores[candidates]))]
+        else:
+            order = np.argsort(-final_scores, kind='stable')
+        
+        return [
+            CategoryScore(
+                keyword_index.category_names[index],
+                float(final_scores[index]),
+                exact=float(exact_scores[index]),
+                fuzzy=float(fuzzy_scores[index])
+            )
+            for index in order.tolist()
+        ]
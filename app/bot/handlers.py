@@ -3,83 +3,433 @@ Handlers para todas las interacciones con Telegram.
 Procesa mensajes y comandos administrativos del bot.
 """
 
-import csv
+import asyncio
 import io
 from datetime import datetime
 from typing import Optional
 
 from telegram import Update
 from telegram.ext import ContextTypes
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, delete
+from sqlalchemy import select, func, delete, insert, update, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import load_only
 
-from app.models import Message, Category, MessageStatistics
-from app.bot.categorizer import MessageCategorizer
-from app.utils import LoggerConfig, StringHelper, FormatterHelper, ValidationHelper
+from app.models import (
+    MESSAGE_CATEGORY_NAME,
+    Category,
+    CategoryStatistics,
+    Keyword,
+    Message,
+    MessageStatistics,
+)
+from app.bot.categorizer import KeywordIndex, MessageCategorizer, SqlKeywordMatcher
+from app.utils import LoggerConfig, StringHelper, FormatterHelper, ValidationHelper, TextNormalizer
 from app.config import config
 
 
+logger = LoggerConfig.setup_logger(__name__)
+
+# Consultas de cada petición, construidas una sola vez al importar el módulo
+_SELECT_CATEGORIES = select(Category).order_by(Category.id)
+_SELECT_CATEGORY_STATISTICS = select(CategoryStatistics)
+_SELECT_CATEGORY_BY_NAME = (
+    select(Category)
+    .options(load_only(Category.id, Category.name, Category.keywords))
+    .where(Category.name == bindparam("name"))
+)
+_SELECT_CATEGORY_IDS = (
+    select(Category.name, Category.id)
+    .where(Category.name.in_(bindparam("names", expanding=True)))
+    .with_for_update(read=True, key_share=True)
+)
+_DELETE_CATEGORY_BY_NAME = (
+    delete(Category)
+    .where(Category.name == bindparam("name"))
+    .returning(Category.id)
+)
+_DELETE_CATEGORY_STATISTICS_BY_NAME = (
+    delete(CategoryStatistics)
+    .where(CategoryStatistics.category == bindparam("name"))
+    .returning(
+        CategoryStatistics.message_count,
+        CategoryStatistics.confidence_sum,
+        CategoryStatistics.confidence_count
+    )
+)
+
+
+async def insert_category(session, category_name: str, keywords: list[str]) -> Optional[int]:
+    """
+    Crea la categoría con un único INSERT ... ON CONFLICT (name) DO NOTHING.
+    Retorna el id de la nueva categoría, o None si ya existía.
+    Al ser un INSERT de Core no se disparan los eventos del mapper, así que
+    las filas de `keywords` se insertan aquí mismo.
+    """
+    result = await session.execute(
+        pg_insert(Category)
+        .values(name=category_name, keywords=keywords)
+        .on_conflict_do_nothing(index_elements=[Category.name])
+        .returning(Category.id)
+    )
+    category_id = result.scalar_one_or_none()
+    if category_id is not None:
+        await session.execute(insert(Keyword), Keyword.build_rows(category_id, keywords))
+    return category_id
+
+
+async def update_category_keywords(session, category_id: int, keywords: list[str]):
+    """
+    Reemplaza las keywords con un UPDATE directo, sin pasar por el flush del
+    ORM. Igual que en insert_category, las filas de `keywords` se
+    sincronizan aquí porque no se disparan los eventos del mapper.
+    """
+    await session.execute(
+        update(Category)
+        .where(Category.id == category_id)
+        .values(keywords=keywords, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    await session.execute(delete(Keyword).where(Keyword.category_id == category_id))
+    await session.execute(insert(Keyword), Keyword.build_rows(category_id, keywords))
+
+
+def build_statistics_upsert(totals: dict[str, list]):
+    """
+    Upsert que suma a category_statistics los agregados de `totals`:
+    {categoría: [mensajes, suma de scores, cantidad de scores]}.
+    """
+    statement = pg_insert(CategoryStatistics).values([
+        {
+            'category': category_name,
+            'message_count': message_count,
+            'confidence_sum': confidence_sum,
+            'confidence_count': confidence_count
+        }
+        for category_name, (message_count, confidence_sum, confidence_count) in totals.items()
+    ])
+    excluded = statement.excluded
+    
+    return statement.on_conflict_do_update(
+        index_elements=[CategoryStatistics.category],
+        set_={
+            'message_count': CategoryStatistics.message_count + excluded.message_count,
+            'confidence_sum': CategoryStatistics.confidence_sum + excluded.confidence_sum,
+            'confidence_count': CategoryStatistics.confidence_count + excluded.confidence_count,
+            'updated_at': func.now()
+        }
+    )
+
+
+async def move_statistics_to_default(session, category_name: str):
+    """
+    Pasa los agregados de una categoría que se elimina a la categoría por
+    defecto, donde quedan sus mensajes (category_id NULL). Debe correr en la
+    misma transacción que el DELETE de la categoría.
+    """
+    result = await session.execute(
+        _DELETE_CATEGORY_STATISTICS_BY_NAME, {"name": category_name}
+    )
+    totals = result.first()
+    if totals is not None and totals.message_count:
+        await session.execute(build_statistics_upsert({config.default_category: list(totals)}))
+
+
+class MessageWriter:
+    """
+    Escritor en lote de mensajes categorizados.
+    Acumula filas en una cola y las inserta con un único INSERT + commit
+    cada `batch_size` mensajes o cada `flush_interval` segundos
+    (MESSAGE_BATCH_SIZE / MESSAGE_FLUSH_INTERVAL por defecto). Los lotes de
+    al menos MESSAGE_COPY_THRESHOLD mensajes se cargan con COPY.
+    Si un lote falla por los datos de alguna fila, se reintenta dividido
+    en mitades, de modo que solo se pierden las filas inválidas. Ante
+    otros errores (conexión, pool, reinicio de la base) se reintenta el
+    lote completo hasta MESSAGE_FLUSH_RETRIES veces, con esperas crecientes
+    desde MESSAGE_RETRY_DELAY segundos; mientras tanto la cola sigue
+    aceptando mensajes y el orden se conserva.
+    
+    Las filas traen el nombre de la categoría; el category_id se resuelve al
+    guardar el lote, para no fallar si la categoría se eliminó mientras el
+    mensaje esperaba en la cola.
+    """
+    
+    _STOP = object()
+    
+    # Clases SQLSTATE atribuibles a las filas: datos inválidos (22) y
+    # violaciones de restricciones (23)
+    DATA_ERROR_SQLSTATE_CLASSES = ("22", "23")
+    
+    def __init__(
+        self,
+        db_session_factory,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        retry_delay: Optional[float] = None
+    ):
+        self.db_session_factory = db_session_factory
+        self.batch_size = batch_size or config.message_batch_size
+        self.flush_interval = flush_interval or config.message_flush_interval
+        self.max_retries = config.message_flush_retries if max_retries is None else max_retries
+        self.retry_delay = retry_delay or config.message_retry_delay
+        self._pending: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("MessageWriter iniciado")
+    
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._pending.put(self._STOP)
+        await self._task
+        self._task = None
+        logger.info("MessageWriter detenido")
+    
+    async def enqueue(self, row: dict):
+        await self._pending.put(row)
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        
+        while not stopping:
+            first_item = await self._pending.get()
+            if first_item is self._STOP:
+                break
+            
+            batch = [first_item]
+            deadline = loop.time() + self.flush_interval
+            
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._pending.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            await self._flush(batch)
+    
+    async def _flush(self, batch: list[dict], attempt: int = 0):
+        try:
+            await self._write_batch(batch)
+            logger.debug("Lote de %d mensajes guardado", len(batch))
+        except Exception as error:
+            if not self._is_data_error(error):
+                await self._retry(batch, attempt, error)
+            elif len(batch) == 1:
+                logger.error("Mensaje descartado por datos inválidos: %s", error)
+            else:
+                logger.warning(
+                    "Error de datos en lote de %d mensajes, se reintenta en mitades: %s",
+                    len(batch), error
+                )
+                middle = len(batch) // 2
+                await self._flush(batch[:middle])
+                await self._flush(batch[middle:])
+    
+    async def _retry(self, batch: list[dict], attempt: int, error: Exception):
+        if attempt >= self.max_retries:
+            logger.error(
+                "Lote de %d mensajes descartado tras %d reintentos: %s",
+                len(batch), attempt, error
+            )
+            return
+        
+        delay = self.retry_delay * 2 ** attempt
+        logger.warning(
+            "Error al guardar lote de %d mensajes, reintento %d/%d en %.1fs: %s",
+            len(batch), attempt + 1, self.max_retries, delay, error
+        )
+        await asyncio.sleep(delay)
+        await self._flush(batch, attempt + 1)
+    
+    def _is_data_error(self, error: Exception) -> bool:
+        # SQLAlchemy expone el error de asyncpg en `orig`; COPY lo lanza sin envolver.
+        # El adaptador de asyncpg no distingue DataError, así que se mira el SQLSTATE.
+        sqlstate = getattr(getattr(error, 'orig', error), 'sqlstate', None)
+        return bool(sqlstate) and sqlstate[:2] in self.DATA_ERROR_SQLSTATE_CLASSES
+    
+    async def _write_batch(self, batch: list[dict]):
+        async with self.db_session_factory() as session:
+            # Primera sentencia del lote: abre la transacción en la que corre el COPY
+            await self._resolve_category_ids(session, batch)
+            await session.execute(self._build_statistics_upsert(batch))
+            if len(batch) >= config.message_copy_threshold:
+                await Message.copy_from(session, batch)
+            else:
+                await Message.bulk_create(session, batch)
+            await session.commit()
+    
+    async def _resolve_category_ids(self, session, batch: list[dict]):
+        """
+        Completa category_id en cada fila a partir de su nombre. FOR KEY SHARE
+        impide que las categorías se eliminen hasta el commit del lote. Los
+        nombres sin fila (la categoría por defecto o una ya eliminada) quedan
+        con category_id NULL y se cuentan en la categoría por defecto.
+        """
+        result = await session.execute(
+            _SELECT_CATEGORY_IDS, {"names": list({row['category'] for row in batch})}
+        )
+        category_ids = dict(result.tuples().all())
+        
+        for row in batch:
+            category_id = category_ids.get(row['category'])
+            row['category_id'] = category_id
+            if category_id is None:
+                row['category'] = config.default_category
+    
+    def _build_statistics_upsert(self, batch: list[dict]):
+        """Suma los agregados del lote a category_statistics en un único upsert."""
+        totals: dict[str, list] = {}
+        for row in batch:
+            category_totals = totals.setdefault(row['category'], [0, 0.0, 0])
+            category_totals[0] += 1
+            if row['confidence_score'] is not None:
+                category_totals[1] += row['confidence_score']
+                category_totals[2] += 1
+        
+        return build_statistics_upsert(totals)
+
+
+class CategoryCache:
+    """
+    Cache en memoria de las categorías configuradas.
+    Evita un SELECT por cada mensaje recibido: la lista se recarga solo
+    cuando un comando de administración incrementa la versión tras su commit.
+    En cada recarga construye también el KeywordIndex, así ningún mensaje
+    paga la reconstrucción del índice, y un diccionario por nombre para las
+    búsquedas de los comandos de keywords.
+    """
+    
+    def __init__(self, db_session_factory):
+        self.db_session_factory = db_session_factory
+        self.version = 0
+        self._loaded_version: Optional[int] = None
+        self._categories: list[Category] = []
+        self.keyword_index: Optional[KeywordIndex] = None
+        self._by_name: dict[str, Category] = {}
+        self._lock = asyncio.Lock()
+    
+    async def get(self) -> list[Category]:
+        if self._loaded_version == self.version:
+            return self._categories
+        
+        async with self._lock:
+            if self._loaded_version != self.version:
+                version = self.version
+                async with self.db_session_factory() as session:
+                    result = await session.execute(_SELECT_CATEGORIES)
+                    categories = list(result.scalars().all())
+                self.keyword_index = KeywordIndex(categories)
+                self._by_name = {category.name: category for category in categories}
+                self._categories = categories
+                self._loaded_version = version
+                logger.debug("Cache de categorías recargado (%d categorías)", len(self._categories))
+        
+        return self._categories
+    
+    async def get_by_name(self, name: str) -> Optional[Category]:
+        await self.get()
+        return self._by_name.get(name)
+    
+    def invalidate(self):
+        self.version += 1
+
+
 class TelegramMessageHandler:
     """
     Handler para procesar mensajes normales de Telegram.
-    Categoriza y guarda mensajes en la base de datos.
+    Categoriza los mensajes y los encola para guardarlos en lote.
     """
     
-    def __init__(self, categorizer: MessageCategorizer, db_session_factory):
+    def __init__(
+        self,
+        categorizer: MessageCategorizer,
+        category_cache: CategoryCache,
+        message_writer: MessageWriter,
+        keyword_matcher: Optional[SqlKeywordMatcher] = None
+    ):
         self.categorizer = categorizer
-        self.db_session_factory = db_session_factory
-        self.logger = LoggerConfig.setup_logger(__name__)
+        self.category_cache = category_cache
+        self.message_writer = message_writer
+        self.keyword_matcher = keyword_matcher
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not update.message or not update.message.text:
             return
         
         message_text = update.message.text
+        text_to_categorize = message_text.strip()
+        if len(text_to_categorize) < config.min_message_length:
+            return
+        # Solo se acota lo que se categoriza; el mensaje se guarda completo
+        is_truncated = len(text_to_categorize) > config.max_message_length
+        text_to_categorize = text_to_categorize[:config.max_message_length]
+        
         telegram_user_id = update.message.from_user.id
         telegram_chat_id = update.message.chat_id
         username = update.message.from_user.username
         chat_type = update.message.chat.type
         
-        async with self.db_session_factory() as session:
-            categories = await self._get_all_categories(session)
-            
-            if not categories:
-                await update.message.reply_text(
-                    "⚠️ No hay categorías configuradas. Usa /add_category para crear una."
-                )
-                return
-            
-            result = self.categorizer.categorize_message(message_text, categories)
-            
-            new_message = Message(
-                telegram_chat_id=telegram_chat_id,
-                telegram_user_id=telegram_user_id,
-                username=username,
-                chat_type=chat_type,
-                message_text=message_text,
-                category=result['category'],
-                confidence_score=result['confidence_score']
+        categories = await self.category_cache.get()
+        
+        if not categories:
+            await update.message.reply_text(
+                "⚠️ No hay categorías configuradas. Usa /add_category para crear una."
             )
-            
-            session.add(new_message)
-            await session.commit()
-            
-            self.logger.info(
-                f"Mensaje guardado: user={telegram_user_id}, "
-                f"category={result['category']}, score={result['confidence_score']:.2f}"
+            return
+        
+        # normalized_text se guarda sobre el texto completo; el categorizador
+        # lo reutiliza salvo que haya recibido el texto acotado
+        normalized_text = TextNormalizer.clean_and_normalize(message_text)
+        normalized_message = None if is_truncated else normalized_text
+        
+        if self.keyword_matcher is not None:
+            result = await self.categorizer.categorize_message_with_sql(
+                text_to_categorize, categories, self.keyword_matcher,
+                keyword_index=self.category_cache.keyword_index,
+                normalized_message=normalized_message
             )
-            
-            confidence_text = FormatterHelper.format_confidence_score(result['confidence_score'])
-            await update.message.reply_text(
-                f"✅ Categorizado como: *{result['category']}*\n"
-                f"🎯 Confianza: {confidence_text}",
-                parse_mode='Markdown'
+        else:
+            result = self.categorizer.categorize_message(
+                text_to_categorize, categories,
+                keyword_index=self.category_cache.keyword_index,
+                normalized_message=normalized_message
             )
+        
+        await self.message_writer.enqueue({
+            'telegram_chat_id': telegram_chat_id,
+            'telegram_user_id': telegram_user_id,
+            'username': username,
+            'chat_type': chat_type,
+            'message_text': message_text,
+            'normalized_text': normalized_text,
+            'category': result.category,
+            'confidence_score': result.score,
+            'created_at': update.message.date
+        })
+        
+        logger.info(
+            "Mensaje encolado: user=%s, category=%s, score=%.2f",
+            telegram_user_id, result.category, result.score
+        )
+        
+        confidence_text = FormatterHelper.format_confidence_score(result.score)
+        await update.message.reply_text(
+            f"✅ Categorizado como: *{result.category}*\n"
+            f"🎯 Confianza: {confidence_text}",
+            parse_mode='Markdown'
+        )
     
-    async def _get_all_categories(self, session: AsyncSession) -> list[Category]:
-        result = await session.execute(select(Category))
-        return result.scalars().all()
-
 
 class CategoryManagementHandler:
     """
@@ -87,9 +437,9 @@ class CategoryManagementHandler:
     Permite agregar, listar y eliminar categorías.
     """
     
-    def __init__(self, db_session_factory):
+    def __init__(self, db_session_factory, category_cache: CategoryCache):
         self.db_session_factory = db_session_factory
-        self.logger = LoggerConfig.setup_logger(__name__)
+        self.category_cache = category_cache
     
     async def handle_add_category(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not context.args or len(context.args) < 2:
@@ -114,23 +464,17 @@ class CategoryManagementHandler:
             return
         
         async with self.db_session_factory() as session:
-            existing = await session.execute(
-                select(Category).where(Category.name == category_name)
-            )
-            if existing.scalar_one_or_none():
+            category_id = await insert_category(session, category_name, keywords)
+            if category_id is None:
                 await update.message.reply_text(
                     f"❌ La categoría '{category_name}' ya existe. Usa /delete_category primero."
                 )
                 return
             
-            new_category = Category(
-                name=category_name,
-                keywords=keywords
-            )
-            session.add(new_category)
             await session.commit()
+            self.category_cache.invalidate()
             
-            self.logger.info(f"Categoría creada: {category_name} con {len(keywords)} keywords")
+            logger.info("Categoría creada: %s con %d keywords", category_name, len(keywords))
             
             formatted_info = FormatterHelper.format_category_info(category_name, keywords)
             await update.message.reply_text(
@@ -138,25 +482,22 @@ class CategoryManagementHandler:
             )
     
     async def handle_list_categories(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        async with self.db_session_factory() as session:
-            result = await session.execute(select(Category))
-            categories = result.scalars().all()
-            
-            if not categories:
-                await update.message.reply_text("📭 No hay categorías configuradas.")
-                return
-            
-            response_lines = ["📚 *Categorías configuradas:*\n"]
-            
-            for category in categories:
-                formatted = FormatterHelper.format_category_info(category.name, category.keywords)
-                response_lines.append(formatted)
-                response_lines.append("")
-            
-            await update.message.reply_text(
-                "\n".join(response_lines),
-                parse_mode='Markdown'
-            )
+        categories = await self.category_cache.get()
+        
+        if not categories:
+            await update.message.reply_text("📭 No hay categorías configuradas.")
+            return
+        
+        response_blocks = ["📚 *Categorías configuradas:*"]
+        response_blocks.extend(
+            FormatterHelper.format_category_info(category.name, category.keywords)
+            for category in categories
+        )
+        
+        await update.message.reply_text(
+            "\n\n".join(response_blocks),
+            parse_mode='Markdown'
+        )
     
     async def handle_delete_category(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not context.args or len(context.args) != 1:
@@ -176,20 +517,18 @@ class CategoryManagementHandler:
         
         async with self.db_session_factory() as session:
             result = await session.execute(
-                select(Category).where(Category.name == category_name)
+                _DELETE_CATEGORY_BY_NAME, {"name": category_name}
             )
-            category = result.scalar_one_or_none()
             
-            if not category:
+            if result.first() is None:
                 await update.message.reply_text(f"❌ La categoría '{category_name}' no existe.")
                 return
             
-            await session.execute(
-                delete(Category).where(Category.name == category_name)
-            )
+            await move_statistics_to_default(session, category_name)
             await session.commit()
+            self.category_cache.invalidate()
             
-            self.logger.info(f"Categoría eliminada: {category_name}")
+            logger.info("Categoría eliminada: %s", category_name)
             await update.message.reply_text(f"✅ Categoría '{category_name}' eliminada exitosamente.")
 
 
@@ -201,40 +540,71 @@ class StatisticsHandler:
     
     def __init__(self, db_session_factory):
         self.db_session_factory = db_session_factory
-        self.logger = LoggerConfig.setup_logger(__name__)
     
     async def handle_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         async with self.db_session_factory() as session:
-            total_result = await session.execute(select(func.count(Message.id)))
-            total_messages = total_result.scalar()
-            
-            if total_messages == 0:
-                await update.message.reply_text("📭 No hay mensajes registrados aún.")
-                return
-            
-            category_result = await session.execute(
-                select(Message.category, func.count(Message.id))
-                .group_by(Message.category)
-            )
-            category_counts = dict(category_result.all())
-            
-            stats_text = FormatterHelper.format_message_stats(total_messages, category_counts)
-            
-            avg_confidence_result = await session.execute(
-                select(Message.category, func.avg(Message.confidence_score))
-                .group_by(Message.category)
+            stats_result = await session.execute(_SELECT_CATEGORY_STATISTICS)
+            category_stats = stats_result.scalars().all()
+        
+        category_counts = {stats.category: stats.message_count for stats in category_stats}
+        avg_confidences = {stats.category: stats.average_confidence for stats in category_stats}
+        total_messages = sum(category_counts.values())
+        
+        if total_messages == 0:
+            await update.message.reply_text("📭 No hay mensajes registrados aún.")
+            return
+        
+        stats_text = FormatterHelper.format_message_stats(total_messages, category_counts)
+        
+        confidence_lines = ["\n📈 *Confianza promedio por categoría:*"]
+        for category_name, avg_score in sorted(avg_confidences.items()):
+            if avg_score is not None:
+                formatted_score = FormatterHelper.format_confidence_score(avg_score)
+                confidence_lines.append(f"  • {category_name}: {formatted_score}")
+        
+        full_stats = stats_text + "\n" + "\n".join(confidence_lines)
+        
+        await update.message.reply_text(full_stats, parse_mode='Markdown')
+    
+    async def handle_rebuild_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        category_count = await self.rebuild_statistics()
+        await update.message.reply_text(
+            f"✅ Estadísticas recalculadas para {category_count} categorías."
+        )
+    
+    async def ensure_statistics(self):
+        """Recalcula los agregados si la tabla está vacía pero ya hay mensajes."""
+        async with self.db_session_factory() as session:
+            has_statistics = await session.scalar(select(select(CategoryStatistics).exists()))
+            has_messages = await session.scalar(select(select(Message).exists()))
+        
+        if has_messages and not has_statistics:
+            await self.rebuild_statistics()
+    
+    async def rebuild_statistics(self) -> int:
+        """Recalcula category_statistics completo a partir de la tabla messages."""
+        async with self.db_session_factory() as session:
+            await session.execute(delete(CategoryStatistics))
+            result = await session.execute(
+                insert(CategoryStatistics)
+                .from_select(
+                    ['category', 'message_count', 'confidence_sum', 'confidence_count', 'updated_at'],
+                    select(
+                        MESSAGE_CATEGORY_NAME,
+                        func.count(Message.id),
+                        func.coalesce(func.sum(Message.confidence_score), 0.0),
+                        func.count(Message.confidence_score),
+                        func.now()
+                    )
+                    .select_from(Message)
+                    .outerjoin(Message.category_ref)
+                    .group_by(MESSAGE_CATEGORY_NAME)
+                )
             )
-            avg_confidences = dict(avg_confidence_result.all())
-            
-            confidence_lines = ["\n📈 *Confianza promedio por categoría:*"]
-            for category_name, avg_score in sorted(avg_confidences.items()):
-                if avg_score is not None:
-                    formatted_score = FormatterHelper.format_confidence_score(avg_score)
-                    confidence_lines.append(f"  • {category_name}: {formatted_score}")
-            
-            full_stats = stats_text + "\n" + "\n".join(confidence_lines)
-            
-            await update.message.reply_text(full_stats, parse_mode='Markdown')
+            await session.commit()
+        
+        logger.info("Estadísticas recalculadas: %d categorías", result.rowcount)
+        return result.rowcount
 
 
 class ExportHandler:
@@ -243,38 +613,47 @@ class ExportHandler:
     Genera archivos CSV con categorías.
     """
     
+    EXPORT_QUERY = (
+        "SELECT name, array_to_string(keywords, ', ') AS keywords "
+        "FROM categories ORDER BY id"
+    )
+    
     def __init__(self, db_session_factory):
         self.db_session_factory = db_session_factory
-        self.logger = LoggerConfig.setup_logger(__name__)
     
     async def handle_export_categories(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        csv_bytes = io.BytesIO()
+        
+        async def write_chunk(data: bytes):
+            csv_bytes.write(data)
+        
+        # COPY genera el CSV en el servidor y lo envía en streaming: sin cargar
+        # objetos Category ni formatear filas en Python
         async with self.db_session_factory() as session:
-            result = await session.execute(select(Category))
-            categories = result.scalars().all()
-            
-            if not categories:
-                await update.message.reply_text("📭 No hay categorías para exportar.")
-                return
-            
-            csv_buffer = io.StringIO()
-            csv_writer = csv.writer(csv_buffer)
-            csv_writer.writerow(['name', 'keywords'])
-            
-            for category in categories:
-                keywords_str = StringHelper.keywords_to_string(category.keywords)
-                csv_writer.writerow([category.name, keywords_str])
-            
-            csv_buffer.seek(0)
-            csv_bytes = io.BytesIO(csv_buffer.getvalue().encode('utf-8'))
-            csv_bytes.name = f"categories_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            
-            await update.message.reply_document(
-                document=csv_bytes,
-                filename=csv_bytes.name,
-                caption="📄 Exportación de categorías"
+            connection = await session.connection()
+            raw_connection = await connection.get_raw_connection()
+            copy_status = await raw_connection.driver_connection.copy_from_query(
+                self.EXPORT_QUERY,
+                output=write_chunk,
+                format='csv',
+                header=True
             )
-            
-            self.logger.info("Categorías exportadas a CSV")
+        
+        exported_count = int(copy_status.split()[-1])
+        if exported_count == 0:
+            await update.message.reply_text("📭 No hay categorías para exportar.")
+            return
+        
+        csv_bytes.seek(0)
+        csv_bytes.name = f"categories_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        
+        await update.message.reply_document(
+            document=csv_bytes,
+            filename=csv_bytes.name,
+            caption="📄 Exportación de categorías"
+        )
+        
+        logger.info("Categorías exportadas a CSV: %d", exported_count)
 
 
 """
@@ -282,7 +661,6 @@ Handler especializado para gestión de palabras clave.
 Agregar esta clase completa al archivo handlers.py
 """
 
-from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
 from sqlalchemy import select
@@ -297,9 +675,9 @@ class KeywordManagementHandler:
     Permite agregar, actualizar y modificar keywords de categorías.
     """
     
-    def __init__(self, db_session_factory):
+    def __init__(self, db_session_factory, category_cache: CategoryCache):
         self.db_session_factory = db_session_factory
-        self.logger = LoggerConfig.setup_logger(__name__)
+        self.category_cache = category_cache
     
     async def handle_add_keywords(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """
@@ -337,12 +715,9 @@ class KeywordManagementHandler:
             )
             return
         
+        existing_category = await self.category_cache.get_by_name(category_name)
+        
         async with self.db_session_factory() as session:
-            result = await session.execute(
-                select(Category).where(Category.name == category_name)
-            )
-            existing_category = result.scalar_one_or_none()
-            
             if existing_category:
                 # Actualizar categoría existente
                 await self._update_existing_category(
@@ -363,15 +738,11 @@ class KeywordManagementHandler:
     ):
         """Actualiza una categoría existente agregando nuevas keywords."""
         current_keywords = set(category.keywords)
-        keywords_added = []
-        keywords_duplicated = []
-        
-        for keyword in new_keywords:
-            if keyword not in current_keywords:
-                current_keywords.add(keyword)
-                keywords_added.append(keyword)
-            else:
-                keywords_duplicated.append(keyword)
+        requested_keywords = dict.fromkeys(new_keywords)
+        added_set = requested_keywords.keys() - current_keywords
+        keywords_added = [kw for kw in requested_keywords if kw in added_set]
+        keywords_duplicated = [kw for kw in requested_keywords if kw not in added_set]
+        current_keywords |= added_set
         
         if not keywords_added:
             await update.message.reply_text(
@@ -383,16 +754,13 @@ class KeywordManagementHandler:
             return
         
         # Actualizar la categoría
-        category.keywords = list(current_keywords)
-        # Solo actualiza updated_at si tu modelo lo tiene
-        if hasattr(category, 'updated_at'):
-            category.updated_at = datetime.utcnow()
-        
+        await update_category_keywords(session, category.id, list(current_keywords))
         await session.commit()
+        self.category_cache.invalidate()
         
-        self.logger.info(
-            f"Keywords agregadas a '{category.name}': "
-            f"{len(keywords_added)} nuevas, {len(keywords_duplicated)} duplicadas"
+        logger.info(
+            "Keywords agregadas a '%s': %d nuevas, %d duplicadas",
+            category.name, len(keywords_added), len(keywords_duplicated)
         )
         
         # Construir respuesta
@@ -421,15 +789,22 @@ class KeywordManagementHandler:
         keywords: list[str]
     ):
         """Crea una nueva categoría con las palabras clave proporcionadas."""
-        new_category = Category(
-            name=category_name,
-            keywords=keywords
-        )
-        session.add(new_category)
+        category_id = await insert_category(session, category_name, keywords)
+        if category_id is None:
+            # Otra petición la creó entre la consulta al cache y el INSERT
+            result = await session.execute(
+                _SELECT_CATEGORY_BY_NAME, {"name": category_name}
+            )
+            await self._update_existing_category(
+                update, session, result.scalar_one(), keywords
+            )
+            return
+        
         await session.commit()
+        self.category_cache.invalidate()
         
-        self.logger.info(
-            f"Categoría creada via /ak: {category_name} con {len(keywords)} keywords"
+        logger.info(
+            "Categoría creada via /ak: %s con %d keywords", category_name, len(keywords)
         )
         
         formatted_info = FormatterHelper.format_category_info(category_name, keywords)
@@ -458,12 +833,9 @@ class KeywordManagementHandler:
         keywords_text = " ".join(context.args[1:])
         keywords_to_remove = StringHelper.string_to_keywords(keywords_text)
         
+        category = await self.category_cache.get_by_name(category_name)
+        
         async with self.db_session_factory() as session:
-            result = await session.execute(
-                select(Category).where(Category.name == category_name)
-            )
-            category = result.scalar_one_or_none()
-            
             if not category:
                 await update.message.reply_text(
                     f"❌ La categoría `{category_name}` no existe.",
@@ -472,15 +844,11 @@ class KeywordManagementHandler:
                 return
             
             current_keywords = set(category.keywords)
-            removed = []
-            not_found = []
-            
-            for keyword in keywords_to_remove:
-                if keyword in current_keywords:
-                    current_keywords.remove(keyword)
-                    removed.append(keyword)
-                else:
-                    not_found.append(keyword)
+            requested_keywords = dict.fromkeys(keywords_to_remove)
+            removed_set = current_keywords & requested_keywords.keys()
+            removed = [kw for kw in requested_keywords if kw in removed_set]
+            not_found = [kw for kw in requested_keywords if kw not in removed_set]
+            current_keywords -= removed_set
             
             if not removed:
                 await update.message.reply_text(
@@ -496,14 +864,12 @@ class KeywordManagementHandler:
                 )
                 return
             
-            category.keywords = list(current_keywords)
-            if hasattr(category, 'updated_at'):
-                category.updated_at = datetime.utcnow()
-            
+            await update_category_keywords(session, category.id, list(current_keywords))
             await session.commit()
+            self.category_cache.invalidate()
             
-            self.logger.info(
-                f"Keywords eliminadas de '{category_name}': {len(removed)}"
+            logger.info(
+                "Keywords eliminadas de '%s': %d", category_name, len(removed)
             )
             
             response = [
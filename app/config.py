@@ -27,11 +27,25 @@ class ApplicationConfig(BaseSettings):
     postgres_db: str = Field(default="telegram_db")
     postgres_host: str = Field(default="postgres")
     postgres_port: int = Field(default=5432)
+    db_pool_size: int = Field(default=20, ge=1)
+    db_max_overflow: int = Field(default=20, ge=0)
+    db_pool_timeout: float = Field(default=10.0, gt=0.0)
+    db_statement_cache_size: int = Field(default=1024, ge=0)
     
     # App
     log_level: str = Field(default="INFO")
     similarity_threshold: float = Field(default=0.7, ge=0.0, le=1.0)
     default_category: str = Field(default="sin_categoria")
+    sql_keyword_matching: bool = Field(default=False)
+    min_message_length: int = Field(default=2, ge=1)
+    max_message_length: int = Field(default=4096, ge=1)
+    
+    # Escritura en lote de mensajes
+    message_batch_size: int = Field(default=500, ge=1)
+    message_flush_interval: float = Field(default=0.2, gt=0.0)
+    message_copy_threshold: int = Field(default=250, ge=1)
+    message_flush_retries: int = Field(default=3, ge=0)
+    message_retry_delay: float = Field(default=1.0, gt=0.0)
     
     @field_validator("log_level")
     @classmethod
@@ -3,9 +3,12 @@ Configuración de base de datos con SQLAlchemy asíncrono.
 Gestiona conexiones, sesiones y creación de tablas.
 """
 
+import asyncio
+import time
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     AsyncSession,
@@ -14,7 +17,7 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from app.config import config
-from app.models import Base
+from app.models import Base, Message
 from app.utils import LoggerConfig
 
 
@@ -27,14 +30,29 @@ class DatabaseManager:
     Maneja el engine, sesiones y ciclo de vida de conexiones.
     """
     
+    CONNECTION_CHECK_TTL = 1.0
+    
+    # Columnas de fecha que se migran de TIMESTAMP a TIMESTAMPTZ
+    TIMESTAMP_COLUMNS = (
+        ("categories", "created_at"),
+        ("categories", "updated_at"),
+        ("messages", "created_at"),
+    )
+    
     def __init__(self):
         self.engine: AsyncEngine = create_async_engine(
             config.database_url,
             echo=config.log_level == "DEBUG",
-            pool_size=5,
-            max_overflow=10,
+            pool_size=config.db_pool_size,
+            max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout,
             pool_pre_ping=True,
-            pool_recycle=3600
+            pool_recycle=3600,
+            query_cache_size=1200,
+            connect_args={
+                "statement_cache_size": config.db_statement_cache_size,
+                "server_settings": {"jit": "off"}
+            }
         )
         
         self.async_session_factory = async_sessionmaker(
@@ -45,13 +63,75 @@ class DatabaseManager:
             autoflush=False
         )
         
+        self._last_check: Optional[tuple[float, bool]] = None
+        
         logger.info("DatabaseManager inicializado correctamente")
     
     async def create_tables(self):
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            # create_all no agrega columnas nuevas a tablas ya existentes
+            await conn.execute(text(
+                "ALTER TABLE messages ADD COLUMN IF NOT EXISTS normalized_text TEXT"
+            ))
+            await self._migrate_timestamps(conn)
+            await self._migrate_message_category(conn)
             logger.info("Tablas de base de datos creadas/verificadas")
     
+    async def _migrate_timestamps(self, conn):
+        """
+        Pasa a TIMESTAMPTZ, con now() como default, las columnas de fecha que
+        en tablas anteriores eran TIMESTAMP sin zona con valores en UTC.
+        """
+        result = await conn.execute(text(
+            "SELECT table_name, column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() "
+            "AND data_type = 'timestamp without time zone'"
+        ))
+        naive_columns = set(result.tuples()) & set(self.TIMESTAMP_COLUMNS)
+        
+        for table_name, column_name in sorted(naive_columns):
+            await conn.execute(text(
+                f"ALTER TABLE {table_name} "
+                f"ALTER COLUMN {column_name} TYPE TIMESTAMPTZ "
+                f"USING {column_name} AT TIME ZONE 'UTC', "
+                f"ALTER COLUMN {column_name} SET DEFAULT now()"
+            ))
+            logger.info("Columna %s.%s migrada a TIMESTAMPTZ", table_name, column_name)
+    
+    async def _migrate_message_category(self, conn):
+        """
+        Reemplaza la columna messages.category (nombre, FK a categories.name)
+        por category_id (FK a categories.id). Los nombres sin categoría
+        asociada, como la categoría por defecto, quedan con category_id NULL.
+        Al eliminar la columna vieja caen también sus índices, que se
+        recrean sobre category_id.
+        """
+        result = await conn.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = current_schema() "
+            "AND table_name = 'messages' AND column_name = 'category'"
+        ))
+        if result.first() is None:
+            return
+        
+        await conn.execute(text(
+            "ALTER TABLE messages ADD COLUMN IF NOT EXISTS category_id INTEGER "
+            "REFERENCES categories (id) ON DELETE SET NULL"
+        ))
+        result = await conn.execute(text(
+            "UPDATE messages SET category_id = c.id "
+            "FROM categories c WHERE messages.category = c.name"
+        ))
+        await conn.execute(text("ALTER TABLE messages DROP COLUMN category"))
+        await conn.run_sync(
+            lambda sync_conn: [
+                index.create(sync_conn, checkfirst=True)
+                for index in Message.__table__.indexes
+            ]
+        )
+        logger.info("messages.category migrada a category_id (%d mensajes)", result.rowcount)
+    
     async def drop_tables(self):
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.drop_all)
@@ -64,20 +144,58 @@ class DatabaseManager:
             yield session
         except Exception as error:
             await session.rollback()
-            logger.error(f"Error en sesión de base de datos: {error}")
+            logger.error("Error en sesión de base de datos: %s", error)
             raise
         finally:
             await session.close()
     
+    async def warm_up_pool(self, connections: Optional[int] = None) -> int:
+        """
+        Abre de antemano `connections` conexiones del pool (DB_POOL_SIZE por
+        defecto) para que la primera ráfaga de mensajes no las cree en serie.
+        """
+        connections = connections or config.db_pool_size
+        
+        async def touch_connection():
+            async with self.engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        
+        await asyncio.gather(*(touch_connection() for _ in range(connections)))
+        return connections
+    
+    def pool_status(self) -> dict:
+        pool = self.engine.pool
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "status": pool.status()
+        }
+    
     async def close(self):
         await self.engine.dispose()
         logger.info("Conexiones de base de datos cerradas")
     
     async def check_connection(self) -> bool:
+        """
+        Verifica la conexión con un SELECT 1.
+        El resultado se reutiliza durante CONNECTION_CHECK_TTL segundos para
+        que los probes de salud frecuentes no ocupen conexiones del pool.
+        """
+        now = time.monotonic()
+        if self._last_check is not None:
+            checked_at, is_connected = self._last_check
+            if now - checked_at < self.CONNECTION_CHECK_TTL:
+                return is_connected
+        
         try:
             async with self.get_session() as session:
-                await session.execute("SELECT 1")
-            return True
+                await session.execute(text("SELECT 1"))
+            is_connected = True
         except Exception as error:
-            logger.error(f"Error al verificar conexión: {error}")
-            return False
\ No newline at end of file
+            logger.error("Error al verificar conexión: %s", error)
+            is_connected = False
+        
+        self._last_check = (time.monotonic(), is_connected)
+        return is_connected
\ No newline at end of file
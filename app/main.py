@@ -4,15 +4,24 @@ Inicializa FastAPI, bot de Telegram y crea tablas de base de datos.
 """
 
 import asyncio
+import time
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 
+try:
+    import uvloop
+except ImportError:  # uvloop no está disponible en Windows
+    uvloop = None
+
 from app.config import config
 from app.database import DatabaseManager
-from app.bot.categorizer import MessageCategorizer
+from app.bot.categorizer import MessageCategorizer, SqlKeywordMatcher
 from app.bot.handlers import (
+    CategoryCache,
+    MessageWriter,
     TelegramMessageHandler,
     CategoryManagementHandler,
     StatisticsHandler,
@@ -36,13 +45,29 @@ class TelegramBotApplication:
         self.categorizer = MessageCategorizer()
         self.telegram_app = None
         
+        self.category_cache = CategoryCache(
+            db_session_factory=self.db_manager.get_session
+        )
+        
+        self.message_writer = MessageWriter(
+            db_session_factory=self.db_manager.get_session
+        )
+        
+        self.keyword_matcher = (
+            SqlKeywordMatcher(db_session_factory=self.db_manager.get_session)
+            if config.sql_keyword_matching else None
+        )
+        
         self.message_handler = TelegramMessageHandler(
             categorizer=self.categorizer,
-            db_session_factory=self.db_manager.get_session
+            category_cache=self.category_cache,
+            message_writer=self.message_writer,
+            keyword_matcher=self.keyword_matcher
         )
         
         self.category_handler = CategoryManagementHandler(
-            db_session_factory=self.db_manager.get_session
+            db_session_factory=self.db_manager.get_session,
+            category_cache=self.category_cache
         )
         
         self.stats_handler = StatisticsHandler(
@@ -54,19 +79,37 @@ class TelegramBotApplication:
         )
 
         self.keyword_management = KeywordManagementHandler(
-            db_session_factory=self.db_manager.get_session
+            db_session_factory=self.db_manager.get_session,
+            category_cache=self.category_cache
         )
     
     async def initialize(self):
         logger.info("Inicializando base de datos...")
         await self.db_manager.create_tables()
+        await self.stats_handler.ensure_statistics()
+        if self.keyword_matcher is not None:
+            await self.keyword_matcher.ensure_keywords()
         logger.info("Base de datos inicializada correctamente")
         
+        self.message_writer.start()
+        
         logger.info("Inicializando bot de Telegram...")
         self.telegram_app = Application.builder().token(config.telegram_bot_token).build()
         
         self._register_handlers()
         logger.info("Handlers registrados correctamente")
+        
+        await self._warm_up()
+    
+    async def _warm_up(self):
+        """Abre el pool y carga las categorías antes de recibir mensajes."""
+        started_at = time.perf_counter()
+        connections = await self.db_manager.warm_up_pool()
+        categories = await self.category_cache.get()
+        logger.info(
+            "Precalentamiento completo: %d conexiones, %d categorías (%.0f ms)",
+            connections, len(categories), (time.perf_counter() - started_at) * 1000
+        )
     
     def _register_handlers(self):
         self.telegram_app.add_handler(
@@ -85,6 +128,10 @@ class TelegramBotApplication:
             CommandHandler(["stats", "s"], self.stats_handler.handle_stats)
         )
         
+        self.telegram_app.add_handler(
+            CommandHandler(["rebuild_stats", "rs"], self.stats_handler.handle_rebuild_stats)
+        )
+        
         self.telegram_app.add_handler(
             CommandHandler("export_categories", self.export_handler.handle_export_categories)
         )
@@ -112,6 +159,7 @@ class TelegramBotApplication:
                 ("list_categories", "lc","📋 Listar categorías"),
                 ("delete_category","dc", "🗑️ Eliminar categoría"),
                 ("stats","s", "📊 Ver estadísticas"),
+                ("rebuild_stats","rs", "♻️ Recalcular estadísticas"),
                 ("export_categories", "💾 Exportar a CSV"),
             ])
         except Exception as e:
@@ -130,6 +178,7 @@ class TelegramBotApplication:
             await self.telegram_app.updater.stop()
             await self.telegram_app.stop()
             await self.telegram_app.shutdown()
+        await self.message_writer.stop()
         await self.db_manager.close()
         logger.info("Bot detenido correctamente")
 
@@ -169,11 +218,25 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {
-        "status": "healthy",
-        "database": "connected",
-        "bot": "active"
-    }
+    database_ok = await bot_application.db_manager.check_connection()
+    # Los probes de Docker/k8s y los balanceadores solo miran el código HTTP
+    return JSONResponse(
+        {
+            "status": "healthy" if database_ok else "unhealthy",
+            "database": "connected" if database_ok else "down",
+            "bot": "active"
+        },
+        status_code=200 if database_ok else 503
+    )
+
+
+async def pool_status():
+    return bot_application.db_manager.pool_status()
+
+
+# Diagnóstico sin autenticación: solo se expone con LOG_LEVEL=DEBUG
+if config.log_level == "DEBUG":
+    app.add_api_route("/debug/pool", pool_status, methods=["GET"])
 
 
 if __name__ == "__main__":
@@ -185,5 +248,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=False,
+        loop="uvloop" if uvloop else "asyncio",
         log_level=config.log_level.lower()
     )
\ No newline at end of file
@@ -5,7 +5,9 @@ Este módulo define las tablas de la base de datos para almacenar
 mensajes categorizados y definiciones de categorías.
 """
 
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timezone
+from operator import attrgetter
 from typing import List, Optional
 
 from sqlalchemy import (
@@ -18,9 +20,47 @@ from sqlalchemy import (
     String,
     Text,
     Index,
+    delete,
+    event,
+    func,
+    inspect,
+    insert,
+    literal,
+    select,
+    text,
 )
 from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    column_property,
+    joinedload,
+    load_only,
+    mapped_column,
+    reconstructor,
+    relationship,
+    validates,
+)
+
+from app.config import config
+from app.utils import TextNormalizer
+
+
+# Claves de to_dict que se copian tal cual; attrgetter las lee en una sola llamada
+_CATEGORY_DICT_KEYS = ("id", "name", "keywords")
+_get_category_values = attrgetter(*_CATEGORY_DICT_KEYS)
+
+_MESSAGE_DICT_KEYS = (
+    "id",
+    "telegram_chat_id",
+    "telegram_user_id",
+    "username",
+    "chat_type",
+    "message_text",
+    "category_id",
+    "confidence_score",
+)
+_get_message_values = attrgetter(*_MESSAGE_DICT_KEYS)
 
 
 class Base(DeclarativeBase):
@@ -42,6 +82,14 @@ class Category(Base):
         created_at: Timestamp de creación del registro
         updated_at: Timestamp de última actualización
         messages: Relación con mensajes que pertenecen a esta categoría
+        message_count: Cantidad de mensajes, calculada con un COUNT en SQL
+            (diferida: cargar con undefer(Category.message_count))
+    
+    Además de las columnas, cada instancia mantiene en memoria las formas
+    normalizadas de sus keywords (no persistidas), recalculadas al cargar
+    desde la base y cada vez que se asigna `keywords`:
+        normalized_keywords: frozenset de keywords normalizadas
+        normalized_text: Texto normalizado de todas las keywords unidas
     """
     
     __tablename__ = "categories"
@@ -53,14 +101,14 @@ class Category(Base):
     
     # Timestamps
     created_at: Mapped[datetime] = mapped_column(
-        DateTime, 
-        default=datetime.utcnow, 
+        DateTime(timezone=True), 
+        server_default=func.now(), 
         nullable=False
     )
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime, 
-        default=datetime.utcnow, 
-        onupdate=datetime.utcnow, 
+        DateTime(timezone=True), 
+        server_default=func.now(), 
+        onupdate=func.now(), 
         nullable=False
     )
     
@@ -71,6 +119,21 @@ class Category(Base):
         cascade="all, delete-orphan"
     )
     
+    @validates("keywords")
+    def _validate_keywords(self, key: str, keywords: List[str]) -> List[str]:
+        self._refresh_normalized_keywords(keywords)
+        return keywords
+    
+    @reconstructor
+    def _init_on_load(self):
+        self._refresh_normalized_keywords(self.keywords)
+    
+    def _refresh_normalized_keywords(self, keywords: List[str]):
+        self.normalized_keywords = frozenset(
+            TextNormalizer.clean_and_normalize(keyword) for keyword in keywords
+        )
+        self.normalized_text = TextNormalizer.clean_and_normalize(" ".join(keywords))
+    
     def __repr__(self) -> str:
         """Representación legible del objeto Category."""
         return f"<Category(id={self.id}, name='{self.name}', keywords_count={len(self.keywords)})>"
@@ -82,14 +145,72 @@ class Category(Base):
         Returns:
             dict: Representación en diccionario del objeto
         """
-        return {
-            "id": self.id,
-            "name": self.name,
-            "keywords": self.keywords,
-            "created_at": self.created_at.isoformat() if self.created_at else None,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
-            "message_count": len(self.messages) if self.messages else 0
-        }
+        data = dict(zip(_CATEGORY_DICT_KEYS, _get_category_values(self)))
+        data["created_at"] = self.created_at.isoformat() if self.created_at else None
+        data["updated_at"] = self.updated_at.isoformat() if self.updated_at else None
+        data["message_count"] = self.message_count or 0
+        return data
+
+
+class Keyword(Base):
+    """
+    Modelo con una fila por palabra clave normalizada de cada categoría.
+    
+    Es la forma normalizada de `Category.keywords`: permite resolver el
+    matching exacto en PostgreSQL con una sola consulta indexada. Las filas
+    se sincronizan automáticamente cuando se guarda una categoría y se
+    eliminan en cascada junto con ella.
+    
+    Attributes:
+        id: Identificador único autoincremental
+        category_id: ID de la categoría a la que pertenece
+        keyword: Keyword normalizada con TextNormalizer.clean_and_normalize
+    """
+    
+    __tablename__ = "keywords"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    category_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("categories.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True
+    )
+    keyword: Mapped[str] = mapped_column(Text, nullable=False)
+    
+    __table_args__ = (
+        Index("idx_keywords_keyword_category", "keyword", "category_id"),
+    )
+    
+    @staticmethod
+    def build_rows(category_id: int, keywords: List[str]) -> List[dict]:
+        """
+        Genera las filas de una categoría. Las keywords repetidas se conservan
+        para que el conteo coincida con el del matching en memoria.
+        """
+        return [
+            {"category_id": category_id, "keyword": TextNormalizer.clean_and_normalize(keyword)}
+            for keyword in keywords
+        ]
+    
+    @classmethod
+    def replace_for_category(cls, connection, category_id: int, keywords: List[str]):
+        """Reemplaza las filas de una categoría (conexión síncrona)."""
+        connection.execute(delete(cls).where(cls.category_id == category_id))
+        rows = cls.build_rows(category_id, keywords)
+        if rows:
+            connection.execute(insert(cls), rows)
+    
+    def __repr__(self) -> str:
+        """Representación legible del objeto Keyword."""
+        return f"<Keyword(category_id={self.category_id}, keyword='{self.keyword}')>"
+
+
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+def _sync_category_keywords(mapper, connection, target: Category):
+    if inspect(target).attrs.keywords.history.has_changes():
+        Keyword.replace_for_category(connection, target.id, target.keywords)
 
 
 class Message(Base):
@@ -106,10 +227,15 @@ class Message(Base):
         username: Nombre de usuario de Telegram (opcional)
         chat_type: Tipo de chat ('private', 'group', 'channel')
         message_text: Texto completo del mensaje
-        category: Nombre de la categoría asignada
+        normalized_text: message_text ya pasado por clean_and_normalize,
+            calculado una sola vez al insertar
+        category_id: ID de la categoría asignada; NULL para la categoría
+            por defecto (que no tiene fila) o si la categoría se eliminó
         confidence_score: Score de confianza de la categorización (0.0 a 1.0)
         created_at: Timestamp de recepción del mensaje
         category_ref: Relación con el objeto Category
+        category: Nombre de la categoría asignada (propiedad, requiere
+            category_ref cargada)
     """
     
     __tablename__ = "messages"
@@ -123,20 +249,20 @@ class Message(Base):
     
     # Contenido del mensaje
     message_text: Mapped[str] = mapped_column(Text, nullable=False)
+    normalized_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     
     # Categorización
-    category: Mapped[str] = mapped_column(
-        String(100), 
-        ForeignKey("categories.name", ondelete="SET NULL"),
-        nullable=False,
-        index=True
+    category_id: Mapped[Optional[int]] = mapped_column(
+        Integer,
+        ForeignKey("categories.id", ondelete="SET NULL"),
+        nullable=True
     )
     confidence_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     
     # Timestamp
     created_at: Mapped[datetime] = mapped_column(
-        DateTime, 
-        default=datetime.utcnow, 
+        DateTime(timezone=True), 
+        server_default=func.now(), 
         nullable=False,
         index=True
     )
@@ -147,16 +273,125 @@ class Message(Base):
         back_populates="messages"
     )
     
+    # Columnas que escriben bulk_create y copy_from. created_at es la hora de
+    # recepción que trae cada fila, no la del guardado del lote.
+    # Las filas pueden traer otras claves (p. ej. 'category').
+    BATCH_COLUMNS = (
+        "telegram_chat_id",
+        "telegram_user_id",
+        "username",
+        "chat_type",
+        "message_text",
+        "normalized_text",
+        "category_id",
+        "confidence_score",
+        "created_at",
+    )
+    
     # Índices compuestos para consultas comunes
     __table_args__ = (
-        Index("idx_messages_category_created", "category", "created_at"),
-        Index("idx_messages_user_category", "telegram_user_id", "category"),
+        Index("idx_messages_category_created", "category_id", "created_at"),
+        Index("idx_messages_user_category", "telegram_user_id", "category_id"),
+        Index(
+            "idx_messages_category_confidence",
+            "category_id",
+            postgresql_include=["confidence_score"]
+        ),
     )
     
+    @property
+    def category(self) -> str:
+        """
+        Nombre de la categoría. Lee category_ref: con AsyncSession hay que
+        cargarla antes (selectinload/joinedload(Message.category_ref), como
+        hace select_for_statistics), porque una carga diferida falla.
+        """
+        if self.category_ref is None:
+            return config.default_category
+        return self.category_ref.name
+    
+    @classmethod
+    async def bulk_create(cls, session, rows: List[dict]):
+        """
+        Inserta un lote de mensajes con un único INSERT de Core (executemany),
+        sin instanciar objetos ORM. El commit queda a cargo del llamador.
+        
+        Args:
+            session: Sesión asíncrona abierta
+            rows: Diccionarios con las columnas de BATCH_COLUMNS
+        """
+        if rows:
+            parameters = [
+                {column: row.get(column) for column in cls.BATCH_COLUMNS}
+                for row in cls._fill_missing_columns(rows)
+            ]
+            await session.execute(_MESSAGE_INSERT, parameters)
+    
+    @staticmethod
+    def _fill_missing_columns(rows: List[dict]) -> List[dict]:
+        """
+        Completa normalized_text y created_at en las filas que no los traen
+        (modifica las filas). COPY no aplica el default del servidor a una
+        columna incluida, así que created_at se completa con la hora actual.
+        """
+        now = datetime.now(timezone.utc)
+        for row in rows:
+            if "normalized_text" not in row:
+                row["normalized_text"] = TextNormalizer.clean_and_normalize(row["message_text"])
+            if row.get("created_at") is None:
+                row["created_at"] = now
+        return rows
+    
+    @classmethod
+    def select_for_statistics(cls):
+        """
+        SELECT de mensajes que carga solo category_id, confidence_score y el
+        nombre de la categoría (joinedload), lo que necesitan los métodos en
+        memoria de MessageStatistics. Evita traer message_text, la columna
+        más pesada de la tabla. De Category se cargan también las keywords,
+        que usa su reconstructor.
+        """
+        return select(cls).options(
+            load_only(cls.category_id, cls.confidence_score),
+            joinedload(cls.category_ref).load_only(Category.name, Category.keywords)
+        )
+    
+    @classmethod
+    async def copy_from(cls, session, rows: List[dict]):
+        """
+        Inserta un lote de mensajes con COPY (copy_records_to_table de asyncpg),
+        dentro de la transacción de la sesión. Evita el parseo y el binding de
+        parámetros por fila, conviene para lotes grandes. El commit queda a
+        cargo del llamador.
+        
+        El adaptador asyncpg de SQLAlchemy abre la transacción real recién con
+        la primera sentencia que ejecuta; si la sesión todavía no ejecutó
+        ninguna, se emite un SELECT 1 para que el COPY no corra en autocommit.
+        
+        Args:
+            session: Sesión asíncrona abierta
+            rows: Diccionarios con las columnas de BATCH_COLUMNS
+        """
+        if not rows:
+            return
+        
+        records = [
+            tuple(row.get(column) for column in cls.BATCH_COLUMNS)
+            for row in cls._fill_missing_columns(rows)
+        ]
+        
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        if not raw_connection.driver_connection.is_in_transaction():
+            await connection.execute(text("SELECT 1"))
+        await raw_connection.driver_connection.copy_records_to_table(
+            cls.__tablename__, records=records, columns=cls.BATCH_COLUMNS
+        )
+    
     def __repr__(self) -> str:
         """Representación legible del objeto Message."""
         text_preview = self.message_text[:50] + "..." if len(self.message_text) > 50 else self.message_text
-        return f"<Message(id={self.id}, category='{self.category}', text='{text_preview}')>"
+        return f"<Message(id={self.id}, category_id={self.category_id}, text='{text_preview}')>"
     
     def to_dict(self) -> dict:
         """
@@ -165,17 +400,72 @@ class Message(Base):
         Returns:
             dict: Representación en diccionario del objeto
         """
-        return {
-            "id": self.id,
-            "telegram_chat_id": self.telegram_chat_id,
-            "telegram_user_id": self.telegram_user_id,
-            "username": self.username,
-            "chat_type": self.chat_type,
-            "message_text": self.message_text,
-            "category": self.category,
-            "confidence_score": self.confidence_score,
-            "created_at": self.created_at.isoformat() if self.created_at else None
-        }
+        data = dict(zip(_MESSAGE_DICT_KEYS, _get_message_values(self)))
+        data["created_at"] = self.created_at.isoformat() if self.created_at else None
+        return data
+
+
+# Se define después de Message porque la subconsulta necesita su tabla
+Category.message_count = column_property(
+    select(func.count(Message.id))
+    .where(Message.category_id == Category.id)
+    .correlate_except(Message)
+    .scalar_subquery(),
+    deferred=True
+)
+
+
+# Nombre de la categoría de cada mensaje en consultas con
+# outerjoin(Message.category_ref): sin categoría es la categoría por defecto.
+# El literal se renderiza en línea para que el GROUP BY coincida con el SELECT.
+MESSAGE_CATEGORY_NAME = func.coalesce(
+    Category.name,
+    literal(config.default_category, literal_execute=True)
+).label("category")
+
+
+# INSERT de Message reutilizado en cada lote de bulk_create
+_MESSAGE_INSERT = insert(Message)
+
+
+class CategoryStatistics(Base):
+    """
+    Modelo con los agregados de mensajes por categoría.
+    
+    Se actualiza de forma incremental en cada lote de mensajes guardado,
+    de modo que /stats se responde en O(#categorías) sin recorrer la
+    tabla de mensajes. Puede recalcularse completo con /rebuild_stats.
+    
+    Attributes:
+        category: Nombre de la categoría (clave primaria)
+        message_count: Cantidad de mensajes de la categoría
+        confidence_sum: Suma de los confidence scores no nulos
+        confidence_count: Cantidad de mensajes con confidence score
+        updated_at: Timestamp de la última actualización
+    """
+    
+    __tablename__ = "category_statistics"
+    
+    category: Mapped[str] = mapped_column(String(100), primary_key=True)
+    message_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    confidence_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    confidence_count: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False
+    )
+    
+    @property
+    def average_confidence(self) -> Optional[float]:
+        if not self.confidence_count:
+            return None
+        return self.confidence_sum / self.confidence_count
+    
+    def __repr__(self) -> str:
+        """Representación legible del objeto CategoryStatistics."""
+        return f"<CategoryStatistics(category='{self.category}', message_count={self.message_count})>"
 
 
 class MessageStatistics:
@@ -184,6 +474,11 @@ class MessageStatistics:
     
     No es un modelo de base de datos, sino una clase helper para
     realizar cálculos y agregaciones sobre los mensajes.
+    
+    Los métodos que reciben una lista trabajan solo en memoria, para
+    quien ya tiene los mensajes cargados; si se cargan para esto, conviene
+    hacerlo con Message.select_for_statistics(). Las variantes `*_sql`
+    agregan directamente en PostgreSQL sin materializar ningún Message.
     """
     
     @staticmethod
@@ -197,11 +492,7 @@ class MessageStatistics:
         Returns:
             dict: Diccionario con conteo por categoría
         """
-        distribution = {}
-        for message in messages:
-            category_name = message.category
-            distribution[category_name] = distribution.get(category_name, 0) + 1
-        return distribution
+        return dict(Counter(message.category for message in messages))
     
     @staticmethod
     def get_average_confidence_by_category(messages: List[Message]) -> dict:
@@ -214,21 +505,60 @@ class MessageStatistics:
         Returns:
             dict: Diccionario con promedio de confidence por categoría
         """
-        category_scores = {}
-        category_counts = {}
+        # Una sola búsqueda en el diccionario por mensaje: [suma, cantidad]
+        category_totals: dict = {}
         
         for message in messages:
             if message.confidence_score is not None:
-                category_name = message.category
-                current_sum = category_scores.get(category_name, 0)
-                current_count = category_counts.get(category_name, 0)
-                
-                category_scores[category_name] = current_sum + message.confidence_score
-                category_counts[category_name] = current_count + 1
+                totals = category_totals.get(message.category)
+                if totals is None:
+                    category_totals[message.category] = [message.confidence_score, 1]
+                else:
+                    totals[0] += message.confidence_score
+                    totals[1] += 1
         
-        averages = {}
-        for category_name, total_score in category_scores.items():
-            count = category_counts[category_name]
-            averages[category_name] = total_score / count if count > 0 else 0.0
+        return {
+            category_name: total_score / count
+            for category_name, (total_score, count) in category_totals.items()
+        }
+    
+    @staticmethod
+    async def get_category_distribution_sql(session) -> dict:
+        """
+        Calcula la distribución de mensajes por categoría con un GROUP BY.
         
-        return averages
\ No newline at end of file
+        Args:
+            session: Sesión asíncrona abierta
+            
+        Returns:
+            dict: Diccionario con conteo por categoría
+        """
+        result = await session.execute(
+            select(MESSAGE_CATEGORY_NAME, func.count())
+            .select_from(Message)
+            .outerjoin(Message.category_ref)
+            .group_by(MESSAGE_CATEGORY_NAME)
+        )
+        return dict(result.tuples().all())
+    
+    @staticmethod
+    async def get_average_confidence_by_category_sql(session) -> dict:
+        """
+        Calcula el promedio de confidence score por categoría con un GROUP BY.
+        Las categorías sin ningún score quedan fuera, igual que en la versión
+        en memoria.
+        
+        Args:
+            session: Sesión asíncrona abierta
+            
+        Returns:
+            dict: Diccionario con promedio de confidence por categoría
+        """
+        result = await session.execute(
+            select(MESSAGE_CATEGORY_NAME, func.avg(Message.confidence_score))
+            .select_from(Message)
+            .outerjoin(Message.category_ref)
+            .where(Message.confidence_score.is_not(None))
+            .group_by(MESSAGE_CATEGORY_NAME)
+        )
+        return dict(result.tuples().all())
\ No newline at end of file
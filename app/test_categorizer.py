@@ -1,4 +1,4 @@
-2"""
+"""
 Script de prueba del categorizador sin necesidad de Telegram.
 Permite probar la lógica de categorización por consola.
 """
@@ -11,38 +11,39 @@ from app.utils import FormatterHelper
 class CategorizerTester:
     """Clase para probar el categorizador con datos de prueba."""
     
+    # Se crean una sola vez; al recibir siempre el mismo objeto, el
+    # categorizador reutiliza su KeywordIndex en lugar de reconstruirlo
+    TEST_CATEGORIES = (
+        Category(
+            id=1,
+            name="trabajo",
+            keywords=["reunion", "meeting", "oficina", "proyecto", "deadline", "tarea"]
+        ),
+        Category(
+            id=2,
+            name="personal",
+            keywords=["familia", "casa", "hogar", "amigos", "cumpleaños"]
+        ),
+        Category(
+            id=3,
+            name="compras",
+            keywords=["tienda", "mercado", "comprar", "shopping", "precio"]
+        ),
+        Category(
+            id=4,
+            name="urgente",
+            keywords=["importante", "critico", "emergencia", "ya", "ahora"]
+        ),
+        Category(
+            id=5,
+            name="finanzas",
+            keywords=["pago", "factura", "banco", "dinero", "transferencia"]
+        ),
+    )
+    
     def __init__(self):
         self.categorizer = MessageCategorizer()
-        self.test_categories = self._create_test_categories()
-    
-    def _create_test_categories(self) -> list[Category]:
-        return [
-            Category(
-                id=1,
-                name="trabajo",
-                keywords=["reunion", "meeting", "oficina", "proyecto", "deadline", "tarea"]
-            ),
-            Category(
-                id=2,
-                name="personal",
-                keywords=["familia", "casa", "hogar", "amigos", "cumpleaños"]
-            ),
-            Category(
-                id=3,
-                name="compras",
-                keywords=["tienda", "mercado", "comprar", "shopping", "precio"]
-            ),
-            Category(
-                id=4,
-                name="urgente",
-                keywords=["importante", "critico", "emergencia", "ya", "ahora"]
-            ),
-            Category(
-                id=5,
-                name="finanzas",
-                keywords=["pago", "factura", "banco", "dinero", "transferencia"]
-            )
-        ]
+        self.test_categories = self.TEST_CATEGORIES
     
     def test_messages(self):
         test_cases = [
@@ -63,16 +64,16 @@ class CategorizerTester:
         print("=" * 70)
         print()
         
-        for idx, message in enumerate(test_cases, 1):
-            result = self.categorizer.categorize_message(message, self.test_categories)
-            
+        results = self.categorizer.categorize_batch(test_cases, self.test_categories)
+        
+        for idx, (message, result) in enumerate(zip(test_cases, results), 1):
             confidence_formatted = FormatterHelper.format_confidence_score(
-                result['confidence_score']
+                result.score
             )
             
             print(f"Prueba #{idx}")
             print(f"Mensaje: {message}")
-            print(f"Categoría: {result['category']}")
+            print(f"Categoría: {result.category}")
             print(f"Confianza: {confidence_formatted}")
             print("-" * 70)
     
@@ -89,10 +90,10 @@ class CategorizerTester:
         
         for score_data in scores:
             print(
-                f"{score_data['category']:<15} "
-                f"{score_data['score']:.3f}     "
-                f"{score_data['exact_matches']:.3f}     "
-                f"{score_data['fuzzy_similarity']:.3f}"
+                f"{score_data.category:<15} "
+                f"{score_data.score:.3f}     "
+                f"{score_data.exact:.3f}     "
+                f"{score_data.fuzzy:.3f}"
             )
         
         print("\n" + "=" * 70)
@@ -120,10 +121,10 @@ class CategorizerTester:
             
             result = self.categorizer.categorize_message(user_input, self.test_categories)
             confidence_formatted = FormatterHelper.format_confidence_score(
-                result['confidence_score']
+                result.score
             )
             
-            print(f"→ Categoría: {result['category']}")
+            print(f"→ Categoría: {result.category}")
             print(f"→ Confianza: {confidence_formatted}\n")
 
 
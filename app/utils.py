@@ -2,24 +2,30 @@
 Utilidades y funciones auxiliares de la aplicación.
 """
 
+import functools
+import heapq
 import logging
 import re
 import unicodedata
+from operator import itemgetter
 from typing import Optional
 
 from app.config import config
 
 
+_WHITESPACE_RUN = re.compile(r'\s+')
+_SPECIAL_CHARACTERS = re.compile(r'[^a-zA-Z0-9\s]')
+_SPECIAL_CHARACTERS_NO_SPACES = re.compile(r'[^a-zA-Z0-9]')
+_SPECIAL_CHARACTERS_RUN = re.compile(r'[^a-zA-Z0-9\s]+')
+_CATEGORY_NAME = re.compile(r'^[a-zA-Z0-9_-]+$')
+
+
 class LoggerConfig:
     """Configuración centralizada del sistema de logging."""
     
-    _loggers = {}
-    
-    @classmethod
-    def setup_logger(cls, name: str) -> logging.Logger:
-        if name in cls._loggers:
-            return cls._loggers[name]
-        
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def setup_logger(name: str) -> logging.Logger:
         logger = logging.getLogger(name)
         logger.setLevel(config.log_level)
         
@@ -34,7 +40,6 @@ class LoggerConfig:
             handler.setFormatter(formatter)
             logger.addHandler(handler)
         
-        cls._loggers[name] = logger
         return logger
 
 
@@ -44,30 +49,31 @@ class TextNormalizer:
     @staticmethod
     def normalize_text(text: str) -> str:
         text_lower = text.lower()
+        # Sin caracteres fuera de ASCII, NFKD + encode('ascii') no cambian nada
+        if text_lower.isascii():
+            return text_lower
         text_normalized = unicodedata.normalize('NFKD', text_lower)
         text_ascii = text_normalized.encode('ascii', 'ignore').decode('ascii')
         return text_ascii
     
     @staticmethod
     def remove_extra_whitespace(text: str) -> str:
-        text_cleaned = re.sub(r'\s+', ' ', text)
+        text_cleaned = _WHITESPACE_RUN.sub(' ', text)
         return text_cleaned.strip()
     
     @staticmethod
     def remove_special_characters(text: str, keep_spaces: bool = True) -> str:
-        if keep_spaces:
-            pattern = r'[^a-zA-Z0-9\s]'
-        else:
-            pattern = r'[^a-zA-Z0-9]'
-        
-        return re.sub(pattern, '', text)
+        pattern = _SPECIAL_CHARACTERS if keep_spaces else _SPECIAL_CHARACTERS_NO_SPACES
+        return pattern.sub('', text)
     
     @staticmethod
     def clean_and_normalize(text: str) -> str:
-        text_no_special = TextNormalizer.remove_special_characters(text, keep_spaces=True)
-        text_no_whitespace = TextNormalizer.remove_extra_whitespace(text_no_special)
-        text_normalized = TextNormalizer.normalize_text(text_no_whitespace)
-        return text_normalized
+        # Mismo resultado que remove_special_characters + remove_extra_whitespace
+        # + normalize_text en una sola pasada de regex: al quitar los
+        # caracteres especiales solo quedan [a-zA-Z0-9] y espacios, así que
+        # split() colapsa los espacios y basta con lower() para normalizar.
+        text_no_special = _SPECIAL_CHARACTERS_RUN.sub('', text)
+        return ' '.join(text_no_special.split()).lower()
 
 
 class StringHelper:
@@ -115,8 +121,7 @@ class ValidationHelper:
             return False
         if len(name) > 100:
             return False
-        pattern = r'^[a-zA-Z0-9_-]+$'
-        return bool(re.match(pattern, name))
+        return bool(_CATEGORY_NAME.match(name))
 
 
 class FormatterHelper:
@@ -134,10 +139,15 @@ class FormatterHelper:
         return f"📁 {category_name}\n🔑 Keywords: {keywords_text}"
     
     @staticmethod
-    def format_message_stats(total: int, by_category: dict) -> str:
+    def format_message_stats(total: int, by_category: dict, top_k: Optional[int] = None) -> str:
         lines = [f"📊 Total de mensajes: {total}\n"]
         
-        for category_name, count in sorted(by_category.items(), key=lambda x: x[1], reverse=True):
+        if top_k is not None:
+            ranked = heapq.nlargest(top_k, by_category.items(), key=itemgetter(1))
+        else:
+            ranked = sorted(by_category.items(), key=itemgetter(1), reverse=True)
+        
+        for category_name, count in ranked:
             percentage = (count / total * 100) if total > 0 else 0
             lines.append(f"  • {category_name}: {count} ({percentage:.1f}%)")
         